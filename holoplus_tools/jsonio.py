@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import os
+from typing import Any
+
+import orjson
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """
+    Writes data to a temporary file, syncs it to disk and then replaces path with it,
+    so readers never see a partially written file.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_json(path: str, data: Any) -> None:
+    """
+    Atomically writes data as 2-space indented JSON (non-ASCII characters kept as is).
+    """
+    write_atomic(path, orjson.dumps(data, option=orjson.OPT_INDENT_2))
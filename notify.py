@@ -1,15 +1,28 @@
 from __future__ import annotations
 
-import json
 import os
-from typing import Any, Dict, List
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+
+# Discord の 1 メッセージあたりの上限
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+MAX_CONTENT = 2000
+
+# Embed description は最大 4096 文字だが、安全のため少し短めに切り詰める
+MAX_DESC = 3800
+
+# 429 / 5xx のときに Webhook への投稿を試みる最大回数
+MAX_ATTEMPTS = 5
 
 
 def load_new_threads(path: str = "new.json") -> List[Dict[str, Any]]:
-    with open(path, encoding="utf-8") as f:
-        data = json.load(f)
+    with open(path, "rb") as f:
+        data = orjson.loads(f.read())
 
     if not isinstance(data, list):
         raise ValueError(f"{path} must be a JSON array")
@@ -20,30 +33,26 @@ def load_new_threads(path: str = "new.json") -> List[Dict[str, Any]]:
 def build_discord_payload(entry: Dict[str, Any]) -> tuple[Dict[str, Any], str | None]:
     channel_name = entry.get("channel_name", "")
     thread: Dict[str, Any] = entry.get("thread") or {}
-    thread_id = entry.get("thread_id") or thread.get("id")
+    # エントリごとに何度も参照するのでメソッドをローカルに束縛しておく
+    tget = thread.get
+    thread_id = entry.get("thread_id") or tget("id")
 
-    translations = thread.get("translations") or {}
+    translations = tget("translations") or {}
     ja = translations.get("ja") or {}
+    jget = ja.get
 
-    title = ja.get("title") or thread.get("title") or ""
-    body = ja.get("body") or thread.get("body") or ""
+    title = jget("title") or tget("title") or ""
+    body = jget("body") or tget("body") or ""
 
     header = f"[{channel_name}] {title}".strip()
 
     # 画像と音声の URL を収集
-    image_urls = thread.get("image_urls") or []
-    voice_clip = thread.get("voice_clip") or {}
+    image_urls = tget("image_urls") or []
+    voice_clip = tget("voice_clip") or {}
     voice_url = voice_clip.get("url")
 
     # 本文を埋め込みの description に載せる
-    desc_lines = []
-    if body:
-        desc_lines.append(body)
-
-    description = "\n".join(desc_lines)
-
-    # Embed description は最大 4096 文字だが、安全のため少し短めに切り詰める
-    MAX_DESC = 3800
+    description = body
     if len(description) > MAX_DESC:
         description = description[: MAX_DESC - 1] + "…"
 
@@ -53,9 +62,10 @@ def build_discord_payload(entry: Dict[str, Any]) -> tuple[Dict[str, Any], str |
     )
 
     # 投稿者情報（あれば）
-    user = thread.get("user") or {}
-    author_name = user.get("name") or channel_name
-    author_icon = user.get("icon_url")
+    user = tget("user") or {}
+    uget = user.get
+    author_name = uget("name") or channel_name
+    author_icon = uget("icon_url")
 
     embed: Dict[str, Any] = {
         "title": title or channel_name or "Holoplus Thread",
@@ -77,8 +87,8 @@ def build_discord_payload(entry: Dict[str, Any]) -> tuple[Dict[str, Any], str |
 
     # content には短いヘッダだけ載せておく
     content = header if header else thread_url or ""
-    if len(content) > 2000:
-        content = content[:1999] + "…"
+    if len(content) > MAX_CONTENT:
+        content = content[: MAX_CONTENT - 1] + "…"
 
     payload: Dict[str, Any] = {"embeds": [embed]}
     if content:
@@ -87,14 +97,121 @@ def build_discord_payload(entry: Dict[str, Any]) -> tuple[Dict[str, Any], str |
     return payload, voice_url
 
 
+def _embed_size(embed: Dict[str, Any]) -> int:
+    """
+    Discord が 1 メッセージあたりの上限として数える埋め込みの文字数を返す。
+    """
+    author = embed.get("author") or {}
+    return (
+        len(embed.get("title") or "")
+        + len(embed.get("description") or "")
+        + len(author.get("name") or "")
+    )
+
+
+def batch_discord_payloads(
+    payloads: Iterable[Dict[str, Any]],
+) -> Iterator[Dict[str, Any]]:
+    """
+    複数の payload の埋め込みを、Discord の上限に収まる範囲で 1 メッセージにまとめる。
+    content は各ヘッダを改行で連結する。
+    """
+    embeds: List[Dict[str, Any]] = []
+    contents: List[str] = []
+    size = 0
+
+    def _flush() -> Dict[str, Any]:
+        batch: Dict[str, Any] = {"embeds": embeds}
+        if contents:
+            batch["content"] = "\n".join(contents)
+        return batch
+
+    for payload in payloads:
+        payload_embeds = payload["embeds"]
+        payload_size = sum(_embed_size(embed) for embed in payload_embeds)
+        content = payload.get("content")
+        content_len = sum(len(c) + 1 for c in contents) + len(content or "")
+
+        if embeds and (
+            len(embeds) + len(payload_embeds) > MAX_EMBEDS_PER_MESSAGE
+            or size + payload_size > MAX_EMBED_CHARS_PER_MESSAGE
+            or content_len > MAX_CONTENT
+        ):
+            yield _flush()
+            embeds, contents, size = [], [], 0
+
+        embeds.extend(payload_embeds)
+        if content:
+            contents.append(content)
+        size += payload_size
+
+    if embeds:
+        yield _flush()
+
+
+def _wait_for_rate_limit(resp: requests.Response) -> None:
+    """
+    Discord のレートリミットのヘッダを見て、バケットを使い切っていれば
+    リセットされるまで待機する。
+    """
+    if resp.headers.get("X-RateLimit-Remaining") != "0":
+        return
+
+    try:
+        reset_after = float(resp.headers.get("X-RateLimit-Reset-After", "0"))
+    except ValueError:
+        return
+
+    if reset_after > 0:
+        time.sleep(reset_after)
+
+
+def _retry_after(resp: requests.Response) -> float:
+    """
+    429 のレスポンスから再送までの待ち時間 (秒) を取り出す。
+    """
+    for name in ("Retry-After", "X-RateLimit-Reset-After"):
+        try:
+            return max(float(resp.headers[name]), 0.0)
+        except (KeyError, ValueError):
+            continue
+    return 1.0
+
+
+def _post_with_retry(send: Callable[[], requests.Response]) -> requests.Response:
+    """
+    send を呼び出して Webhook に投稿する。
+    429 はヘッダの待ち時間、5xx は指数バックオフで待機してから再送する。
+    """
+    attempt = 0
+    while True:
+        resp = send()
+        attempt += 1
+
+        retryable = resp.status_code == 429 or 500 <= resp.status_code < 600
+        if not retryable or attempt >= MAX_ATTEMPTS:
+            _wait_for_rate_limit(resp)
+            return resp
+
+        if resp.status_code == 429:
+            time.sleep(_retry_after(resp))
+        else:
+            time.sleep(2 ** (attempt - 1))
+
+
 def send_discord_webhook(
-    webhook_url: str, payload: Dict[str, Any], voice_url: str | None
+    session: requests.Session,
+    webhook_url: str,
+    payload: Dict[str, Any],
+    voice_url: str | None,
 ) -> None:
     # まず埋め込みのみ送信
-    resp = requests.post(
-        webhook_url,
-        json=payload,
-        timeout=10,
+    resp = _post_with_retry(
+        lambda: session.post(
+            webhook_url,
+            json=payload,
+            timeout=10,
+        )
     )
     try:
         resp.raise_for_status()
@@ -103,16 +220,6 @@ def send_discord_webhook(
         raise SystemExit(f"Webhook failed: {exc} - {resp.text}") from exc
 
     if voice_url:
-        # 次に、音声ファイルをダウンロードして添付として送信することで、
-        # Discord 上で再生 UI が表示されるようにする
-        audio_resp = requests.get(voice_url, timeout=60)
-        try:
-            audio_resp.raise_for_status()
-        except requests.HTTPError as exc:
-            raise SystemExit(
-                f"Failed to download voice clip: {exc} - {audio_resp.text}"
-            ) from exc
-
         # ファイル名は常に voice-clip + 拡張子 とする
         filename = "voice-clip.m4a"
         # 拡張子を URL から推測できる場合はそれを使う
@@ -121,11 +228,31 @@ def send_discord_webhook(
             ext = "." + url_path.split(".")[-1]
             filename = f"voice-clip{ext}"
 
-        resp2 = requests.post(
-            webhook_url,
-            files={"file": (filename, audio_resp.content)},
-            timeout=60,
-        )
+        def _send_voice_clip() -> requests.Response:
+            # 次に、音声ファイルをダウンロードして添付として送信することで、
+            # Discord 上で再生 UI が表示されるようにする
+            # requests は multipart の本体を組み立てる際に raw を read() するので、
+            # 音声データはアップロード時点で結局メモリに載る。ここで省けるのは
+            # audio_resp.content を本体の組み立て後も保持し続ける分だけ。
+            # raw は一度しか読めないので、再送のたびにダウンロードし直す
+            with session.get(voice_url, stream=True, timeout=60) as audio_resp:
+                try:
+                    audio_resp.raise_for_status()
+                except requests.HTTPError as exc:
+                    raise SystemExit(
+                        f"Failed to download voice clip: {exc} - {audio_resp.text}"
+                    ) from exc
+
+                # Content-Encoding が付いていても展開済みのバイト列を送る
+                audio_resp.raw.decode_content = True
+
+                return session.post(
+                    webhook_url,
+                    files={"file": (filename, audio_resp.raw, "audio/mp4")},
+                    timeout=60,
+                )
+
+        resp2 = _post_with_retry(_send_voice_clip)
         try:
             resp2.raise_for_status()
         except requests.HTTPError as exc:
@@ -144,11 +271,39 @@ def main() -> None:
         print("new.json に新規スレッドはありません。何も送信しません。")
         return
 
-    for entry in entries:
-        payload, voice_url = build_discord_payload(entry)
-        send_discord_webhook(webhook_url, payload, voice_url)
-
-    print(f"Sent {len(entries)} messages to Discord webhook.")
+    # Webhook の投稿と音声のダウンロードで接続を使い回す。
+    # 埋め込みと音声の順序を保つため、投稿は順番に行い、
+    # レートリミットに達したらヘッダに従って待機する
+    sent = 0
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8)
+        session.mount("https://", adapter)
+
+        # 音声のないスレッドは埋め込みをまとめて 1 メッセージで送る
+        pending: List[Dict[str, Any]] = []
+
+        def _flush_pending() -> None:
+            nonlocal sent
+            for batch in batch_discord_payloads(pending):
+                send_discord_webhook(session, webhook_url, batch, None)
+                sent += 1
+            pending.clear()
+
+        for entry in entries:
+            payload, voice_url = build_discord_payload(entry)
+            if not voice_url:
+                pending.append(payload)
+                continue
+
+            # 音声は埋め込みの直後に続けて送る必要があるので、単独で送信する
+            _flush_pending()
+            send_discord_webhook(session, webhook_url, payload, voice_url)
+            # 埋め込みと音声の添付で 2 回投稿している
+            sent += 2
+
+        _flush_pending()
+
+    print(f"Sent {len(entries)} threads in {sent} messages to Discord webhook.")
 
 
 if __name__ == "__main__":
@@ -2,19 +2,134 @@ from __future__ import annotations
 
 import argparse
 import asyncio
-import json
+import hashlib
+import heapq
 import os
-from typing import Any, Dict, Iterator, List
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, pairwise
+from typing import AbstractSet, Any, Callable, Dict, Iterator, List
 
+import orjson
 import requests
-from tqdm import tqdm
+from requests.adapters import HTTPAdapter
+from tqdm.asyncio import tqdm_asyncio
+
+from holoplus_tools.jsonio import write_atomic, write_json
+
+# チャンネルを同時に取得するスレッド数の上限。
+# 全件取得ではスレッドがページ送りの間ずっと占有されるので、API に負荷をかけすぎないよう抑える
+_MAX_WORKERS = 16
+
+# 1 リクエストで取得するスレッド数。API が受け付けない場合は従来の 20 件に戻す
+DEFAULT_PAGE_SIZE = 100
+_FALLBACK_PAGE_SIZE = 20
+
+NEWEST_PATH = "talent-channel-newest.json"
+# 既知の thread_id を 1 行 1 件で保存するサイドカーファイル
+THREAD_IDS_PATH = "existing_thread_ids.txt"
+
+# 認証ヘッダ以外はリクエストごとに変わらないので使い回す
+_HEADERS = {
+    "user-agent": "Dart/3.9 (dart:io)",
+    "accept-language": "ja",
+    "host": "api.holoplus.com",
+    "content-type": "text/plain; charset=utf-8",
+    "app-version": "3.1.1 (904)",
+}
+
+# 動的なデータ は差分の対象から外したいので、JSON には出力しない
+_DROP_KEYS = (
+    "updated_at",
+    "reaction_total",
+    "reply_count",
+    "is_favorite",
+    "user_reacted_count",
+)
+
+
+def _read_previous_archive() -> bytes | None:
+    """
+    既存の talent-channel-newest.json をバイト列のまま読み込む。
+    初回実行などでファイルがなければ None を返す。
+    """
+    try:
+        with open(NEWEST_PATH, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _parse_previous_results(raw: bytes | None) -> List[Dict[str, Any]] | None:
+    """
+    talent-channel-newest.json の内容をパースする。
+    ファイルがない、または壊れている場合は None を返す。
+    """
+    if raw is None:
+        return None
+
+    try:
+        data = orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return None
+
+    return data if isinstance(data, list) else None
+
+
+def _thread_ids(rows: List[Dict[str, Any]]) -> set[str]:
+    return {
+        row["thread_id"]
+        for row in rows
+        if isinstance(row.get("thread_id"), str) and row["thread_id"]
+    }
+
+
+def _archive_digest(raw: bytes) -> str:
+    return f"sha256:{hashlib.sha256(raw).hexdigest()}"
+
+
+def _load_existing_thread_ids(raw: bytes) -> set[str] | None:
+    """
+    サイドカーファイルから既知の thread_id を読み込む。
+    サイドカーの先頭行には書き出したときの talent-channel-newest.json のハッシュが入っており、
+    現在のファイル (raw) と一致しない場合 (書き込み途中で落ちた、手で編集された、
+    壊れている など) やサイドカーがない場合は None を返す。
+    """
+    try:
+        with open(THREAD_IDS_PATH, encoding="utf-8") as f:
+            header, _, body = f.read().partition("\n")
+    except FileNotFoundError:
+        return None
+
+    if header != _archive_digest(raw):
+        return None
+
+    return set(body.split("\n")) - {""}
+
+
+def _write_thread_ids(thread_ids: AbstractSet[str], archive_raw: bytes) -> None:
+    """
+    既知の thread_id を、対応する talent-channel-newest.json のハッシュと一緒に保存する。
+    """
+    lines = [f"{_archive_digest(archive_raw)}\n"]
+    lines.extend(f"{thread_id}\n" for thread_id in sorted(thread_ids))
+    write_atomic(THREAD_IDS_PATH, "".join(lines).encode())
+
+
+def _created_at(row: Dict[str, Any]) -> int:
+    """
+    ソート用に thread.created_at を取り出す。
+    """
+    return (row.get("thread") or {}).get("created_at", 0)
 
 
 def fetch_newest_threads(
+    session: requests.Session,
     auth_token: str,
     channel_id: str,
     *,
-    limit: int = 20,
+    limit: int = DEFAULT_PAGE_SIZE,
     cursor: str | None = None,
     timeout: int = 10,
 ) -> Dict[str, Any]:
@@ -23,37 +138,102 @@ def fetch_newest_threads(
     """
     url = "https://api.holoplus.com/v4/talent-channel/threads/newest"
 
-    headers = {
-        "user-agent": "Dart/3.9 (dart:io)",
-        "accept-language": "ja",
-        "host": "api.holoplus.com",
-        "authorization": f"Bearer {auth_token}",
-        "content-type": "text/plain; charset=utf-8",
-        "app-version": "3.1.1 (904)",
-    }
+    headers = _HEADERS | {"authorization": f"Bearer {auth_token}"}
 
     params: Dict[str, str] = {"channel_id": channel_id, "limit": str(limit)}
     if cursor:
         params["cursor"] = cursor
 
-    resp = requests.get(url, headers=headers, params=params, timeout=timeout)
+    resp = session.get(url, headers=headers, params=params, timeout=timeout)
     resp.raise_for_status()
-    return resp.json()
+    # ボディのバイト列を直接デコードする（str への変換を挟まない）
+    return orjson.loads(resp.content)
+
+
+class SharedPageSize:
+    """
+    全チャンネルで共有するページサイズ。
+    最初のリクエストで API が受け付けるかを確かめ、400 が返った場合は
+    以降のすべてのリクエストを従来の件数に切り替える。
+    確認が済むまで、他のチャンネルのリクエストは待たせる。
+    """
+
+    def __init__(self, requested: int) -> None:
+        self._value = requested
+        self._resolved = requested <= _FALLBACK_PAGE_SIZE
+        self._lock = threading.Lock()
+
+    def fetch(self, fetch: Callable[[int], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        現在のページサイズで fetch を呼び出す。
+        """
+        if not self._resolved:
+            with self._lock:
+                if not self._resolved:
+                    try:
+                        data = fetch(self._value)
+                    except requests.HTTPError as exc:
+                        if exc.response is None or exc.response.status_code != 400:
+                            raise
+                        print(
+                            f"Warning: page size {self._value} was rejected by the API "
+                            f"(HTTP 400); falling back to {_FALLBACK_PAGE_SIZE}.",
+                            file=sys.stderr,
+                        )
+                        self._value = _FALLBACK_PAGE_SIZE
+                        self._resolved = True
+                    else:
+                        self._resolved = True
+                        return data
+
+        return fetch(self._value)
+
+
+def _fetch_page(
+    session: requests.Session,
+    auth_token: str,
+    channel_id: str,
+    *,
+    page_size: SharedPageSize,
+    cursor: str | None = None,
+    timeout: int = 10,
+) -> Dict[str, Any]:
+    """
+    共有のページサイズで 1 ページ分のスレッドを取得する。
+    """
+    return page_size.fetch(
+        lambda limit: fetch_newest_threads(
+            session,
+            auth_token=auth_token,
+            channel_id=channel_id,
+            limit=limit,
+            cursor=cursor,
+            timeout=timeout,
+        )
+    )
 
 
 def iter_all_threads(
-    auth_token: str, channel_id: str, *, limit: int = 20, timeout: int = 10
+    session: requests.Session,
+    auth_token: str,
+    channel_id: str,
+    *,
+    page_size: SharedPageSize | None = None,
+    timeout: int = 10,
 ) -> Iterator[Dict[str, Any]]:
     """
     カーソルを使って、指定チャンネルのスレッドを全件取得するイテレータ。
     """
+    if page_size is None:
+        page_size = SharedPageSize(DEFAULT_PAGE_SIZE)
     cursor: str | None = None
 
     while True:
-        data = fetch_newest_threads(
+        data = _fetch_page(
+            session,
             auth_token=auth_token,
             channel_id=channel_id,
-            limit=limit,
+            page_size=page_size,
             cursor=cursor,
             timeout=timeout,
         )
@@ -71,58 +251,58 @@ def iter_all_threads(
 
 
 def _collect_threads_for_channel_sync(
+    session: requests.Session,
     auth_token: str,
     channel_id: str,
     channel_name: str,
     all_threads: bool,
     *,
-    limit: int = 20,
+    known_thread_ids: AbstractSet[str] = frozenset(),
+    page_size: SharedPageSize | None = None,
     timeout: int = 10,
 ) -> List[Dict[str, Any]]:
     """
     単一チャンネル分のスレッド情報を同期的に収集するヘルパー。
+    全件取得時は、known_thread_ids に含まれる thread に到達した時点で打ち切る。
     """
+    if page_size is None:
+        page_size = SharedPageSize(DEFAULT_PAGE_SIZE)
     results: List[Dict[str, Any]] = []
 
-    def _sanitize_thread(thread: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        動的なデータ は差分の対象から外したいので、
-        JSON には出力しないよう削除したコピーを返す。
-        """
-        sanitized = dict(thread)
-        sanitized.pop("updated_at", None)
-        sanitized.pop("reaction_total", None)
-        sanitized.pop("reply_count", None)
-        sanitized.pop("is_favorite", None)
-        sanitized.pop("user_reacted_count", None)
-        return sanitized
-
     if all_threads:
         for thread in iter_all_threads(
+            session,
             auth_token=auth_token,
             channel_id=channel_id,
-            limit=limit,
+            page_size=page_size,
             timeout=timeout,
         ):
             thread_id = thread.get("id", "")
             if not thread_id:
                 continue
 
-            sanitized_thread = _sanitize_thread(thread)
+            # スレッドは新しい順に返ってくるので、既知の thread 以降はすべて取得済み
+            if thread_id in known_thread_ids:
+                break
+
+            # API レスポンスの dict はここでしか使わないので、コピーせずに直接削除する
+            for key in _DROP_KEYS:
+                thread.pop(key, None)
 
             results.append(
                 {
                     "channel_id": channel_id,
                     "channel_name": channel_name,
                     "thread_id": thread_id,
-                    "thread": sanitized_thread,
+                    "thread": thread,
                 }
             )
     else:
-        data = fetch_newest_threads(
+        data = _fetch_page(
+            session,
             auth_token=auth_token,
             channel_id=channel_id,
-            limit=limit,
+            page_size=page_size,
             timeout=timeout,
         )
         items = data.get("items") or []
@@ -132,13 +312,15 @@ def _collect_threads_for_channel_sync(
             if not thread_id:
                 continue
 
-            sanitized_thread = _sanitize_thread(thread)
+            for key in _DROP_KEYS:
+                thread.pop(key, None)
+
             results.append(
                 {
                     "channel_id": channel_id,
                     "channel_name": channel_name,
                     "thread_id": thread_id,
-                    "thread": sanitized_thread,
+                    "thread": thread,
                 }
             )
 
@@ -146,31 +328,47 @@ def _collect_threads_for_channel_sync(
 
 
 async def _collect_threads_for_channel(
+    session: requests.Session,
     auth_token: str,
     channel_id: str,
     channel_name: str,
     all_threads: bool,
+    *,
+    known_thread_ids: AbstractSet[str] = frozenset(),
+    page_size: SharedPageSize | None = None,
 ) -> List[Dict[str, Any]]:
     """
     単一チャンネル分のスレッド情報を別スレッドで取得する非同期ラッパー。
     """
     return await asyncio.to_thread(
         _collect_threads_for_channel_sync,
+        session,
         auth_token,
         channel_id,
         channel_name,
         all_threads,
+        known_thread_ids=known_thread_ids,
+        page_size=page_size,
     )
 
 
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value}")
+    return number
+
+
 async def _main_async() -> None:
     """
     talent-channel.json を読み込み、それぞれのチャンネルの最新スレッドを取得する。
     --all オプション指定時は、カーソルを使って全件取得する。
+    ただし既知のスレッドに到達した時点で打ち切る (--full を付けると最後まで取得する)。
 
     結果は API のスレッドレスポンス（各 item）をそのまま保持しつつ
     thread.created_at でソートし、新しいものが先頭になるように並べて
     単一の JSON ファイル (talent-channel-newest.json) に保存する。
+    既知の thread_id は次回の実行用に existing_thread_ids.txt にも保存する。
     """
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -178,6 +376,17 @@ async def _main_async() -> None:
         action="store_true",
         help="各チャンネルのスレッドをカーソルで全件取得して表示する",
     )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="--all 指定時に、既知のスレッドに到達しても打ち切らずに最後まで取得する",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=_positive_int,
+        default=DEFAULT_PAGE_SIZE,
+        help=f"1 リクエストで取得するスレッド数 (既定: {DEFAULT_PAGE_SIZE})",
+    )
     args = parser.parse_args()
 
     auth_token = os.environ.get("HOLOPLUS_TOKEN")
@@ -186,91 +395,131 @@ async def _main_async() -> None:
             "環境変数 HOLOPLUS_TOKEN に Bearer トークンを設定してください。"
         )
 
-    with open("talent-channel.json", encoding="utf-8") as f:
-        rows = json.load(f)
+    with open("talent-channel.json", "rb") as f:
+        rows = orjson.loads(f.read())
 
-    # 既存の talent-channel-newest.json を読み込み、既知の thread_id を集める
-    existing_thread_ids: set[str] = set()
-    previous_results: List[Dict[str, Any]] = []
-    try:
-        with open("talent-channel-newest.json", encoding="utf-8") as f:
-            previous_results = json.load(f)
-        for row in previous_results:
-            thread_id = row.get("thread_id")
-            if isinstance(thread_id, str) and thread_id:
-                existing_thread_ids.add(thread_id)
-    except FileNotFoundError:
-        # 初回実行などでファイルがなければ、既知のスレッドはなしとみなす
-        existing_thread_ids = set()
-        previous_results = []
-    except json.JSONDecodeError:
-        # 壊れたファイルなどは無視して再生成する
-        existing_thread_ids = set()
-        previous_results = []
-
-    # チャンネルごとに並列で取得
-    tasks: List[asyncio.Task[List[Dict[str, Any]]]] = []
-    for row in rows:
-        channel_id = row.get("id", "")
-        channel_name = row.get("name", "")
-        if not channel_id:
-            continue
+    # 既知の thread_id は、talent-channel-newest.json と対応が取れていれば
+    # サイドカーファイルから読み込み、そうでなければ JSON から集める。
+    # 既存のスレッドはパース結果を保持せず、マージが必要になったときに
+    # 生のバイト列から改めてパースする
+    previous_raw = _read_previous_archive()
+    existing_thread_ids = (
+        _load_existing_thread_ids(previous_raw) if previous_raw is not None else None
+    )
+    has_sidecar = existing_thread_ids is not None
+    if existing_thread_ids is None:
+        previous_results = _parse_previous_results(previous_raw)
+        if previous_results is None:
+            # ファイルがない、または壊れている場合は既知のスレッドはなしとみなして再生成する
+            previous_raw = None
+        existing_thread_ids = _thread_ids(previous_results or [])
+        del previous_results
+    has_previous = previous_raw is not None
+
+    channels = [
+        (row.get("id", ""), row.get("name", "")) for row in rows if row.get("id")
+    ]
+
+    # 処理はほぼ HTTP 待ちなので、既定のスレッドプールの大きさに縛られないよう
+    # 上限までチャンネル数分のスレッドと接続を用意する。
+    # 上限を超えた分はプールのキューで待ち、先に終わったチャンネルの後に順次実行される
+    workers = max(min(len(channels), _MAX_WORKERS), 1)
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=workers)
+    )
 
-        tasks.append(
-            _collect_threads_for_channel(
-                auth_token=auth_token,
-                channel_id=channel_id,
-                channel_name=channel_name,
-                all_threads=bool(args.all),
+    # チャンネルごとに並列で取得（全チャンネルで単一のセッションを共有し、接続を使い回す）
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        session.mount("https://", adapter)
+
+        # ページサイズの判定は全チャンネルで 1 回だけ行い、結果を共有する
+        page_size = SharedPageSize(args.page_size)
+
+        tasks: List[asyncio.Task[List[Dict[str, Any]]]] = []
+        for channel_id, channel_name in channels:
+            tasks.append(
+                _collect_threads_for_channel(
+                    session,
+                    auth_token=auth_token,
+                    channel_id=channel_id,
+                    channel_name=channel_name,
+                    all_threads=bool(args.all),
+                    known_thread_ids=(
+                        frozenset() if args.full else existing_thread_ids
+                    ),
+                    page_size=page_size,
+                )
             )
-        )
 
-    per_channel_results: List[List[Dict[str, Any]]] = []
-    with tqdm(total=len(tasks), desc="Fetching threads") as pbar:
-        for coro in asyncio.as_completed(tasks):
-            channel_items = await coro
-            per_channel_results.append(channel_items)
-            pbar.update(1)
+        per_channel_results: List[List[Dict[str, Any]]] = [
+            await coro
+            for coro in tqdm_asyncio.as_completed(
+                tasks, total=len(tasks), desc="Fetching threads"
+            )
+        ]
 
-    results: List[Dict[str, Any]] = [
-        item for channel_items in per_channel_results for item in channel_items
-    ]
+    results: List[Dict[str, Any]] = list(chain.from_iterable(per_channel_results))
 
-    # 既存の JSON に含まれていない thread のみ抽出（重複は thread_id で排除）
+    # 既存の JSON に含まれていない thread のみ抽出（重複は thread_id で排除）。
+    # 複数チャンネルに同じ thread が出ることがあるので、既知の集合に追加しながら見る
+    # (thread_id が空の thread は収集時に除外済み)
     new_results: List[Dict[str, Any]] = []
     for row in results:
-        thread_id = row.get("thread_id")
-        if not isinstance(thread_id, str) or not thread_id:
-            continue
+        thread_id = row["thread_id"]
         if thread_id in existing_thread_ids:
             continue
         existing_thread_ids.add(thread_id)
         new_results.append(row)
 
-    # 既存 + 新規をまとめて thread.created_at でソートして保存（新しいものを先頭に）
-    merged_results: List[Dict[str, Any]] = previous_results + new_results
-    merged_results.sort(
-        key=lambda row: (row.get("thread") or {}).get("created_at", 0),
-        reverse=True,
-    )
+    # 新規分だけを thread.created_at でソートする（新しいものを先頭に）
+    new_results.sort(key=_created_at, reverse=True)
+
+    if new_results or not has_previous:
+        # 既存の JSON は通常は前回の実行でソート済みなので、全体を並べ直さずにマージして保存。
+        # 手で編集された場合などに備えて、並びが崩れていればソートし直す
+        previous_results = _parse_previous_results(previous_raw) or []
+        if any(
+            _created_at(prev) < _created_at(row)
+            for prev, row in pairwise(previous_results)
+        ):
+            previous_results.sort(key=_created_at, reverse=True)
+
+        merged_results: List[Dict[str, Any]] = list(
+            heapq.merge(
+                previous_results,
+                new_results,
+                key=_created_at,
+                reverse=True,
+            )
+        )
 
-    with open("talent-channel-newest.json", "w", encoding="utf-8") as f:
-        json.dump(merged_results, f, ensure_ascii=False, indent=2)
+        archive_raw = orjson.dumps(merged_results, option=orjson.OPT_INDENT_2)
+        write_atomic(NEWEST_PATH, archive_raw)
+        archive_thread_ids = _thread_ids(merged_results)
 
-    print(
-        f"Saved {len(merged_results)} threads to talent-channel-newest.json "
-        f"(including {len(new_results)} new threads, "
-        f"{'all' if args.all else 'latest per channel'} fetched this run)."
-    )
+        print(
+            f"Saved {len(merged_results)} threads to talent-channel-newest.json "
+            f"(including {len(new_results)} new threads, "
+            f"{'all' if args.all else 'latest per channel'} fetched this run)."
+        )
+    else:
+        # 新規がなければ既存ファイルの内容は変わらないので書き直さない
+        # (has_previous なので previous_raw は None ではない)
+        assert previous_raw is not None
+        archive_raw = previous_raw
+        archive_thread_ids = existing_thread_ids
+        print(
+            f"No new threads; talent-channel-newest.json is unchanged "
+            f"({'all' if args.all else 'latest per channel'} fetched this run)."
+        )
 
-    # 新規 thread のみ new.json として保存
-    new_results.sort(
-        key=lambda row: (row.get("thread") or {}).get("created_at", 0),
-        reverse=True,
-    )
+    # 実際に保存されている thread_id をサイドカーファイルに保存
+    if new_results or not has_previous or not has_sidecar:
+        _write_thread_ids(archive_thread_ids, archive_raw)
 
-    with open("new.json", "w", encoding="utf-8") as f:
-        json.dump(new_results, f, ensure_ascii=False, indent=2)
+    # 新規 thread のみ new.json として保存（ソート済み）
+    write_json("new.json", new_results)
 
     print(f"Saved {len(new_results)} new threads to new.json.")
 
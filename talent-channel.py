@@ -1,11 +1,12 @@
 from __future__ import annotations
 
-import json
 import os
 from typing import Any, Dict, List
 
 import requests
 
+from holoplus_tools.jsonio import write_json
+
 
 def fetch_talent_channels(auth_token: str, timeout: int = 10) -> Dict[str, Any]:
     """
@@ -42,8 +43,7 @@ def save_talent_channels_to_csv(items: List[Dict[str, Any]], path: str) -> None:
         for item in sorted_items
     ]
 
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    write_json(path, payload)
 
 
 def main() -> None: